@@ -0,0 +1,77 @@
+#
+# file: flag_space.py
+# function: map the get_flag() option list onto the unit hypercube
+#
+
+
+import math
+import numpy as np
+from typing import List
+from getFlags import Option
+
+
+class flag_space():
+    """The search space spanned by a list of options from :code:`get_flag()`.
+
+    A configuration is a list of choices, one per option, in the same format
+    used by :code:`test.py`: :code:`-1` leaves the option out, any other value
+    is an index into the option.
+
+    Every option is also given a coordinate in :code:`[0, 1)` so that samplers
+    and designs can work on a plain hypercube. Options with at most
+    :code:`max_categorical` settings are split into equal cells (one for the
+    absent value and one per setting). Wider integer options use a log scale:
+    the lower half of the coordinate leaves the option out and the upper half
+    maps to an index that grows exponentially, so small values are explored as
+    densely as huge ones.
+    """
+
+    def __init__(self, options: List[Option], max_categorical: int = 256) -> None:
+        self.options = options
+        self.sizes = np.array([len(opt) for opt in options], dtype=np.int64)
+        self.log_scale = self.sizes > max_categorical
+
+    def __len__(self):
+        return len(self.options)
+
+    def from_unit(self, u) -> List[int]:
+        """Convert a point of the unit hypercube into a list of choices."""
+        choices = []
+        for x, n, log_scale in zip(u, self.sizes, self.log_scale):
+            x = min(max(float(x), 0.0), math.nextafter(1.0, 0.0))
+            if log_scale:
+                if x < 0.5:
+                    choices.append(-1)
+                else:
+                    v = (x - 0.5) * 2
+                    choices.append(min(int(math.exp(v * math.log(n + 1))) - 1, int(n) - 1))
+            else:
+                choices.append(int(x * (n + 1)) - 1)
+        return choices
+
+    def to_unit(self, choices: List[int]) -> np.ndarray:
+        """Convert a list of choices into the centre of its hypercube cell."""
+        u = np.empty(len(self.options))
+        for i, (c, n, log_scale) in enumerate(zip(choices, self.sizes, self.log_scale)):
+            if log_scale:
+                if c < 0:
+                    u[i] = 0.25
+                else:
+                    v = math.log(c + 1.5) / math.log(n + 1)
+                    u[i] = 0.5 + min(v, 1.0) / 2
+            else:
+                u[i] = (c + 1.5) / (n + 1)
+        return u
+
+    def random(self, rng: np.random.Generator) -> List[int]:
+        """Draw a configuration uniformly over the hypercube."""
+        return self.from_unit(rng.random(len(self.options)))
+
+    def to_opts(self, choices: List[int]) -> List[str]:
+        """Get the command line arguments for a list of choices."""
+        assert len(choices) == len(self.options)
+        return [
+            option[choice]
+            for option, choice in zip(self.options, choices)
+            if choice >= 0
+        ]
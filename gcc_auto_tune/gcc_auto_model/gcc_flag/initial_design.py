@@ -0,0 +1,77 @@
+#
+# file: initial_design.py
+# function: space-filling initial designs (Sobol / Latin hypercube) over the gcc option space
+#
+
+
+import warnings
+import numpy as np
+from typing import List, Optional
+from scipy.stats import qmc
+import getFlags
+from flag_space import flag_space
+
+
+class space_filling_design():
+    """Generate batches of configurations that cover the option space evenly.
+
+    :code:`method` is :code:`"sobol"` (scrambled Sobol sequence) or
+    :code:`"lhs"` (Latin hypercube). Consecutive Sobol batches continue the
+    same sequence, so the union of all batches stays low-discrepancy; batch
+    sizes that are powers of two keep the best balance. Each Latin hypercube
+    batch is stratified on its own.
+
+    With :code:`stratify_o` the :code:`-O` option is not sampled from the
+    design: the levels are dealt out in turn, carrying on from where the
+    previous batch stopped, so every batch is split as evenly as possible and
+    all batches together stay balanced. A batch smaller than the number of
+    levels gets distinct levels, and the next batches cover the rest.
+    The same seed always gives the same sequence of batches.
+    """
+
+    def __init__(self, space: flag_space, method: str = "sobol",
+                 stratify_o: bool = False, seed: Optional[int] = None) -> None:
+        self.space = space
+        self.method = method
+        self.rng = np.random.default_rng(seed)
+        if method == "sobol":
+            self.engine = qmc.Sobol(len(space), scramble=True, seed=self.rng)
+        elif method == "lhs":
+            self.engine = qmc.LatinHypercube(len(space), seed=self.rng)
+        else:
+            raise ValueError(f"Unknown design method '{method}'")
+
+        self.o_index = None
+        self.o_offset = 0
+        if stratify_o:
+            for i, option in enumerate(space.options):
+                if isinstance(option, getFlags.GccOOption):
+                    self.o_index = i
+                    break
+            else:
+                raise ValueError("No -O option in the space to stratify on")
+
+    def next_batch(self, n: int) -> List[List[int]]:
+        """Get the next :code:`n` configurations of the design."""
+        with warnings.catch_warnings():
+            # Sobol warns when n is not a power of two
+            warnings.simplefilter("ignore", UserWarning)
+            u = self.engine.random(n)
+
+        if self.o_index is not None:
+            # Deal the -O levels round-robin across batches. Index 0 of the
+            # unit cell is the absent value, so levels start from cell 1.
+            levels = len(self.space.options[self.o_index])
+            assigned = (self.o_offset + np.arange(n)) % levels
+            self.o_offset = (self.o_offset + n) % levels
+            self.rng.shuffle(assigned)
+            u[:, self.o_index] = (assigned + 1.5) / (levels + 1)
+
+        return [self.space.from_unit(x) for x in u]
+
+
+if __name__ == "__main__":
+    space = flag_space(getFlags.get_flag())
+    design = space_filling_design(space, stratify_o=True, seed=0)
+    for choices in design.next_batch(8):
+        print("opts = ", space.to_opts(choices))
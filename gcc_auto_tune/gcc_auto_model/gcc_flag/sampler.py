@@ -0,0 +1,174 @@
+#
+# file: sampler.py
+# function: model-based batch sampler (TPE) over the gcc option space
+#
+
+
+import math
+import numpy as np
+from typing import List, Optional, Tuple
+import getFlags
+from flag_space import flag_space
+
+
+def _parzen_bandwidth(mu: np.ndarray) -> float:
+    # Scott's rule, kept away from zero so repeated points still spread a bit
+    if len(mu) < 2:
+        return 0.5
+    return float(np.clip(1.06 * np.std(mu) * len(mu) ** -0.2, 0.02, 0.5))
+
+
+def _parzen_logpdf(x: np.ndarray, mu: np.ndarray, prior_weight: float) -> np.ndarray:
+    """Log density of a Gaussian Parzen window over [0, 1] mixed with a uniform
+    prior of weight :code:`prior_weight`.
+    """
+    if len(mu) == 0:
+        return np.zeros(len(x))
+    sigma = _parzen_bandwidth(mu)
+    z = (x[:, None] - mu[None, :]) / sigma
+    kernels = np.exp(-0.5 * z * z) / (sigma * math.sqrt(2 * math.pi))
+    return np.log((kernels.sum(axis=1) + prior_weight) / (len(mu) + prior_weight))
+
+
+def _parzen_sample(rng: np.random.Generator, mu: np.ndarray, prior_weight: float, size: int) -> np.ndarray:
+    """Draw from the mixture described in :code:`_parzen_logpdf()`."""
+    if len(mu) == 0:
+        return rng.random(size)
+    sigma = _parzen_bandwidth(mu)
+    weights = np.append(np.ones(len(mu)), prior_weight)
+    component = rng.choice(len(weights), size=size, p=weights / weights.sum())
+    x = rng.random(size)
+    from_kernel = component < len(mu)
+    x[from_kernel] = rng.normal(mu[component[from_kernel]], sigma)
+    return np.clip(x, 0.0, math.nextafter(1.0, 0.0))
+
+
+class tpe_sampler():
+    """Tree-structured Parzen Estimator that proposes batches of configurations.
+
+    Drivers use it through an ask/tell loop::
+
+        sampler = tpe_sampler(flag_space(getFlags.get_flag()), batch_size=8)
+        while ...:
+            batch = sampler.ask()
+            costs = [evaluate(sampler.space.to_opts(c)) for c in batch]
+            sampler.tell(batch, costs)
+
+    Costs are minimized (e.g. run time). A failed build or run can be reported
+    as :code:`float("inf")`. Until :code:`n_startup` observations have been
+    told, batches come from :code:`initial_design` (any object with a
+    :code:`next_batch(n)` method, such as :code:`space_filling_design`) or are
+    drawn uniformly if there is none. After that each option is modelled
+    independently with one density for the best :code:`gamma` fraction of the
+    observations and one for the rest, and the candidate with the highest
+    ratio is proposed.
+    Configurations that have been asked but not told yet are treated as the
+    worst observation so far ("constant liar"), which keeps the members of a
+    batch from collapsing onto the same point.
+    """
+
+    def __init__(self, space: flag_space, batch_size: int = 1, gamma: float = 0.25,
+                 n_startup: int = 20, n_candidates: int = 64,
+                 prior_weight: float = 1.0, initial_design=None,
+                 seed: Optional[int] = None) -> None:
+        self.space = space
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.n_startup = n_startup
+        self.n_candidates = n_candidates
+        self.prior_weight = prior_weight
+        self.initial_design = initial_design
+        self.rng = np.random.default_rng(seed)
+        self.history = []
+        self.pending = []
+        self.unit = {}
+
+    def ask(self, q: Optional[int] = None) -> List[List[int]]:
+        """Propose :code:`q` configurations (default: :code:`batch_size`)."""
+        q = q or self.batch_size
+        # the model needs at least one observation, whatever n_startup says
+        if len(self.history) < max(self.n_startup, 1):
+            if self.initial_design is not None:
+                batch = self.initial_design.next_batch(q)
+            else:
+                batch = [self.space.random(self.rng) for _ in range(q)]
+            self.pending.extend(batch)
+            return batch
+
+        batch = []
+        for _ in range(q):
+            choices = self.suggest()
+            batch.append(choices)
+            self.pending.append(choices)
+        return batch
+
+    def tell(self, batch: List[List[int]], costs: List[float]) -> None:
+        """Report the measured cost of each configuration in :code:`batch`."""
+        assert len(batch) == len(costs)
+        for choices, cost in zip(batch, costs):
+            if choices in self.pending:
+                self.pending.remove(choices)
+            self.history.append((list(choices), float(cost)))
+
+    def suggest(self) -> List[int]:
+        """Propose one configuration from the current model, or a uniform draw
+        if nothing has been told yet.
+        """
+        if not self.history:
+            return self.space.random(self.rng)
+        finite = [cost for _, cost in self.history if math.isfinite(cost)]
+        lie = max(finite) if finite else math.inf
+        observed = self.history + [(choices, lie) for choices in self.pending]
+
+        costs = np.array([cost for _, cost in observed])
+        order = np.argsort(costs, kind="stable")
+        n_good = max(1, int(math.ceil(self.gamma * len(self.history))))
+        u = np.array([self._to_unit(choices) for choices, _ in observed])
+        good, bad = u[order[:n_good]], u[order[n_good:]]
+
+        candidates = np.empty((self.n_candidates, len(self.space)))
+        score = np.zeros(self.n_candidates)
+        for j, (n, log_scale) in enumerate(zip(self.space.sizes, self.space.log_scale)):
+            if log_scale:
+                x = _parzen_sample(self.rng, good[:, j], self.prior_weight, self.n_candidates)
+                score += _parzen_logpdf(x, good[:, j], self.prior_weight)
+                score -= _parzen_logpdf(x, bad[:, j], self.prior_weight)
+                candidates[:, j] = x
+            else:
+                # Categorical: the absent value plus one bin per setting
+                bins = int(n) + 1
+                p_good = self._histogram(good[:, j], bins)
+                p_bad = self._histogram(bad[:, j], bins)
+                k = self.rng.choice(bins, size=self.n_candidates, p=p_good)
+                score += np.log(p_good[k]) - np.log(p_bad[k])
+                candidates[:, j] = (k + 0.5) / bins
+
+        return self.space.from_unit(candidates[np.argmax(score)])
+
+    def best(self) -> Tuple[List[int], float]:
+        """The lowest cost configuration told so far."""
+        return min(self.history, key=lambda x: x[1])
+
+    def evaluations_to_reach(self, cost: float) -> Optional[int]:
+        """Number of evaluations it took to first reach :code:`cost`, or None."""
+        for i, (_, c) in enumerate(self.history):
+            if c <= cost:
+                return i + 1
+        return None
+
+    def _histogram(self, x: np.ndarray, bins: int) -> np.ndarray:
+        counts = np.bincount((x * bins).astype(np.int64), minlength=bins)
+        return (counts + self.prior_weight / bins) / (len(x) + self.prior_weight)
+
+    def _to_unit(self, choices: List[int]) -> np.ndarray:
+        key = tuple(choices)
+        if key not in self.unit:
+            self.unit[key] = self.space.to_unit(choices)
+        return self.unit[key]
+
+
+if __name__ == "__main__":
+    space = flag_space(getFlags.get_flag())
+    sampler = tpe_sampler(space, batch_size=4)
+    for choices in sampler.ask():
+        print("opts = ", space.to_opts(choices))
@@ -0,0 +1,156 @@
+#
+# file: build.py
+# function: compile cBench programs per translation unit with an object cache
+#
+
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import subprocess
+import threading
+import hashlib
+import shlex
+import shutil
+import glob
+import os
+import re
+
+
+def _sha256(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class cbench_builder():
+    """Build a cBench program without going through its Makefile.
+
+    The extra compile and link arguments are read from the program's
+    :code:`Makefile.gcc`. Every translation unit is compiled on its own on a
+    pool of :code:`jobs` workers, and the object file is cached under
+    :code:`cache_dir` by the hash of the preprocessed source, the flags and the
+    compiler id. Linked binaries are cached the same way by the hash of their
+    objects, so a configuration that was already built is never recompiled or
+    relinked.
+
+    :code:`objects` maps each source to its object from the last build.
+    """
+
+    def __init__(self, src_dir: str, cache_dir: str = "./build_cache",
+                 jobs: Optional[int] = None, compiler: str = "gcc") -> None:
+        self.src_dir = os.path.abspath(src_dir)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.jobs = jobs or os.cpu_count()
+        self.slots = threading.BoundedSemaphore(self.jobs)
+        self.compiler = compiler
+        self.cflags = []
+        self.ldflags = []
+        self.sources = sorted(
+            os.path.basename(f) for f in glob.glob(os.path.join(self.src_dir, "*.c"))
+        )
+        self.objects = {}
+        self.compiler_id = self.get_compiler_id()
+        self.parse_makefile()
+        os.makedirs(os.path.join(self.cache_dir, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "binaries"), exist_ok=True)
+
+    def source_hash(self) -> str:
+        """Hash of the program's sources and headers."""
+        files = sorted(glob.glob(os.path.join(self.src_dir, "*.[ch]")))
+        contents = []
+        for path in files:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        return _sha256(*[os.path.basename(path) for path in files], *contents)
+
+    def get_compiler_id(self) -> str:
+        version = subprocess.check_output([self.compiler, "--version"])
+        machine = subprocess.check_output([self.compiler, "-dumpmachine"])
+        return _sha256(version, machine)
+
+    # get the extra compile / link arguments from the "all" rule of Makefile.gcc
+    def parse_makefile(self) -> None:
+        target = None
+        with open(os.path.join(self.src_dir, "Makefile.gcc"), 'r') as f:
+            for line in f:
+                m = re.match(r"([A-Za-z_]+):", line)
+                if m:
+                    target = m.group(1)
+                if not line.startswith('\t') or target != "all":
+                    continue
+                args = shlex.split(re.sub(r"\$\([A-Z_]+\)", "", line))
+                if "*.c" in args:
+                    self.cflags = [arg for arg in args if arg not in ("-c", "*.c")]
+                elif "*.o" in args:
+                    self.ldflags = [arg for arg in args if arg != "*.o"]
+
+    def run(self, cmd) -> bytes:
+        # at most self.jobs compiler processes, however many builds run at once
+        with self.slots:
+            result = subprocess.run(cmd, cwd=self.src_dir, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, check=True)
+        return result.stdout
+
+    # run a command ending in "-o" into a temporary file, then move it into the cache
+    def publish(self, cmd: List[str], path: str) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            self.run(cmd + [tmp])
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def compile_unit(self, source: str, flags: List[str]) -> str:
+        """Compile one translation unit and return the cached object path."""
+        args = self.cflags + flags
+        if any(flag.startswith("-fprofile-") for flag in flags):
+            # name the .gcda file after the source rather than the temporary
+            # object, so -fprofile-use finds what -fprofile-generate wrote
+            args = args + ["-dumpdir", self.src_dir + "/", "-dumpbase", source]
+        preprocessed = self.run([self.compiler] + args + ["-E", source])
+        key = _sha256(preprocessed, *args, self.compiler_id)
+        obj = os.path.join(self.cache_dir, "objects", key + ".o")
+        if not os.path.exists(obj):
+            self.publish([self.compiler] + args + ["-c", source, "-o"], obj)
+        return obj
+
+    def link(self, objects: List[str], flags: List[str]) -> str:
+        """Link the objects and return the cached binary path."""
+        key = _sha256(*objects, *flags, *self.ldflags, self.compiler_id)
+        binary = os.path.join(self.cache_dir, "binaries", key)
+        if not os.path.exists(binary):
+            self.publish([self.compiler] + flags + objects + self.ldflags + ["-o"], binary)
+        return binary
+
+    def build(self, flags: List[str], output: Optional[str] = "a.out",
+              tu_flags: Optional[Dict[str, List[str]]] = None) -> str:
+        """Build the program with :code:`flags`.
+
+        :code:`tu_flags` optionally maps source file names to the flags used
+        for those translation units instead of :code:`flags`.
+
+        The binary is copied to :code:`output` in the source directory (where
+        :code:`__run` expects it) unless :code:`output` is None. Returns the
+        cached binary path. Raises :code:`subprocess.CalledProcessError` if a
+        compile or link step fails.
+        """
+        tu_flags = tu_flags or {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            objects = list(pool.map(
+                lambda src: self.compile_unit(src, tu_flags.get(src, flags)), self.sources
+            ))
+        self.objects = dict(zip(self.sources, objects))
+        binary = self.link(objects, flags)
+        if output is not None:
+            target = os.path.join(self.src_dir, output)
+            shutil.copy2(binary, target + ".tmp")
+            os.replace(target + ".tmp", target)
+        return binary
+
+
+if __name__ == "__main__":
+    builder = cbench_builder("./benchmark/cBench/automotive_bitcount/src_work")
+    print(builder.build(["-O2"]))
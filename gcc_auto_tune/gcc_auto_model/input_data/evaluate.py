@@ -0,0 +1,109 @@
+#
+# file: evaluate.py
+# function: build a cBench program with given flags and time one of its datasets
+#
+
+
+from typing import Dict, List, Optional, Tuple
+import subprocess
+import statistics
+import threading
+import hashlib
+import time
+import os
+from build import cbench_builder
+
+
+_run_lock = threading.Lock()
+
+def get_dataset_info(src_dir: str, dataset: int) -> Tuple[str, int]:
+    """Get the command line and loop-wrap count of a dataset from
+    :code:`_ccc_info_datasets`, the same way :code:`__run` looks them up.
+    """
+    with open(os.path.join(src_dir, "_ccc_info_datasets"), 'r') as f:
+        lines = [line.rstrip('\n') for line in f]
+    for i, line in enumerate(lines):
+        if line == "=====" and int(lines[i + 1]) == dataset:
+            return lines[i + 2], int(lines[i + 3])
+    raise ValueError(f"Can't find dataset {dataset} in {src_dir}/_ccc_info_datasets")
+
+
+class cbench_evaluator():
+    """Time a cBench program on one dataset.
+
+    The binary comes from :code:`builder` and is run directly from the build
+    cache with the dataset's command line, inside the program's directory.
+    Like :code:`__run`, each run first writes the dataset's loop-wrap count to
+    :code:`_finfo_dataset`, where :code:`loop-wrap.c` reads it.
+    The cost of a configuration is the median wall time of :code:`repeats`
+    runs, or :code:`float("inf")` if it fails to build or run.
+
+    Measurements are cached by the contents of the binary, so flag sets that
+    end up generating the same code are only timed once. Drivers that want
+    to build in parallel call :code:`build()` from several threads and then
+    :code:`measure()` the results one by one.
+
+    With a :code:`pgo` stage every candidate is built with :code:`-fprofile-use`
+    against that stage's cached training profile.
+    """
+
+    def __init__(self, builder: cbench_builder, dataset: int = 1, repeats: int = 3,
+                 pgo=None) -> None:
+        self.builder = builder
+        self.pgo = pgo
+        self.dataset = dataset
+        self.repeats = repeats
+        self.cmd, self.loop_wrap = get_dataset_info(builder.src_dir, dataset)
+        self.measurements = {}
+
+    def run(self, binary: str, prefix: str = "") -> float:
+        """Run :code:`binary` once on the dataset and return its wall time.
+
+        Timed runs never overlap each other, even across evaluators and threads.
+        """
+        with _run_lock:
+            with open(os.path.join(self.builder.src_dir, "_finfo_dataset"), 'w') as f:
+                f.write(f"{self.loop_wrap}\n")
+            start = time.perf_counter()
+            subprocess.run(f"{prefix} {binary} {self.cmd}", shell=True, check=True,
+                           cwd=self.builder.src_dir, stdout=subprocess.DEVNULL)
+            return time.perf_counter() - start
+
+    def build(self, flags: List[str], tu_flags: Optional[Dict[str, List[str]]] = None) -> Optional[str]:
+        """Build a configuration and return its cached binary, or None if the
+        build fails. Safe to call from several threads at once. Raises
+        :code:`RuntimeError` if the :code:`pgo` stage's training failed.
+        """
+        # a broken PGO training setup is not a candidate failure, so it raises
+        if self.pgo is not None:
+            flags = self.pgo.use_flags(flags)
+            tu_flags = self.pgo.use_tu_flags(tu_flags)
+        try:
+            return self.builder.build(flags, output=None, tu_flags=tu_flags)
+        except subprocess.CalledProcessError:
+            return None
+
+    def measure(self, binary: Optional[str]) -> float:
+        """Cost of a binary from :code:`build()`."""
+        if binary is None:
+            return float("inf")
+        with open(binary, 'rb') as f:
+            key = hashlib.sha256(f.read()).hexdigest()
+        if key not in self.measurements:
+            try:
+                self.measurements[key] = statistics.median(
+                    self.run(binary) for _ in range(self.repeats)
+                )
+            except subprocess.CalledProcessError:
+                return float("inf")
+        return self.measurements[key]
+
+    def evaluate(self, flags: List[str], tu_flags: Optional[Dict[str, List[str]]] = None) -> float:
+        return self.measure(self.build(flags, tu_flags))
+
+
+if __name__ == "__main__":
+    builder = cbench_builder("./benchmark/cBench/automotive_bitcount/src_work")
+    evaluator = cbench_evaluator(builder)
+    for flags in (["-O0"], ["-O2"], ["-O3"]):
+        print(flags, evaluator.evaluate(flags))
@@ -0,0 +1,195 @@
+#
+# file: hot_tune.py
+# function: tune flags only for the translation units holding the hot functions
+#
+
+
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+import subprocess
+import logging
+import tempfile
+import shutil
+import os
+import re
+from build import cbench_builder
+from evaluate import cbench_evaluator
+
+
+logger = logging.getLogger(__name__)
+
+def _base_name(symbol: str) -> str:
+    # foo.constprop.0, foo.part.1, foo.isra.0 ... all belong to foo
+    return symbol.split('.')[0]
+
+
+class function_profiler():
+    """Attribute the run time of a cBench program to its functions.
+
+    Uses :code:`perf record` when perf is installed. Otherwise the program is
+    rebuilt with :code:`-pg` and sampled with gprof. The sample fractions are
+    scaled by the unprofiled run time, so the result is in seconds.
+    """
+
+    def __init__(self, evaluator: cbench_evaluator) -> None:
+        self.evaluator = evaluator
+        self.builder = evaluator.builder
+        self.use_perf = shutil.which("perf") is not None
+
+    def perf_fractions(self, flags: List[str], tu_flags: Dict[str, List[str]]) -> Dict[str, float]:
+        binary = self.builder.build(flags, output=None, tu_flags=tu_flags)
+        with tempfile.TemporaryDirectory() as tmp:
+            data = os.path.join(tmp, "perf.data")
+            self.evaluator.run(binary, prefix=f"perf record -q -o {data} --")
+            report = subprocess.check_output(
+                ["perf", "report", "-i", data, "--stdio", "--no-children",
+                 "--dsos", binary, "--sort", "symbol"],
+                universal_newlines=True, stderr=subprocess.DEVNULL
+            )
+        pattern = re.compile(r"\s*([0-9.]+)%\s+\[\.\]\s+(\S+)")
+        fractions = defaultdict(float)
+        for line in report.splitlines():
+            m = pattern.match(line)
+            if m:
+                fractions[_base_name(m.group(2))] += float(m.group(1)) / 100
+        return fractions
+
+    def gprof_fractions(self, flags: List[str], tu_flags: Dict[str, List[str]]) -> Dict[str, float]:
+        flags = flags + ["-pg"]
+        tu_flags = {src: tu + ["-pg"] for src, tu in tu_flags.items()}
+        binary = self.builder.build(flags, output=None, tu_flags=tu_flags)
+        gmon = os.path.join(self.builder.src_dir, "gmon.out")
+        try:
+            self.evaluator.run(binary)
+            report = subprocess.check_output(["gprof", "-b", "-p", binary, gmon],
+                                             universal_newlines=True)
+        finally:
+            if os.path.exists(gmon):
+                os.remove(gmon)
+        # flat profile: % time, cumulative s, self s, [calls, self/call, total/call,] name
+        pattern = re.compile(r"\s*([0-9.]+)\s+[0-9.]+\s+[0-9.]+\s+(?:\S+\s+){0,3}(\S+)$")
+        fractions = defaultdict(float)
+        for line in report.splitlines():
+            m = pattern.match(line)
+            if m:
+                fractions[_base_name(m.group(2))] += float(m.group(1)) / 100
+        return fractions
+
+    def profile(self, flags: List[str], tu_flags: Optional[Dict[str, List[str]]] = None) -> Dict[str, float]:
+        """Seconds spent in each function when built with :code:`flags`."""
+        tu_flags = tu_flags or {}
+        if self.use_perf:
+            fractions = self.perf_fractions(flags, tu_flags)
+        else:
+            fractions = self.gprof_fractions(flags, tu_flags)
+        if not fractions:
+            raise RuntimeError(f"Empty profile for {self.builder.src_dir}")
+        runtime = self.evaluator.evaluate(flags, tu_flags)
+        return {func: fraction * runtime for func, fraction in fractions.items()}
+
+
+class hot_tuner():
+    """Search a flag configuration only for the hot translation units.
+
+    The baseline binary is profiled, functions are taken hottest first until
+    they cover :code:`coverage` of the profiled time, and the sources that
+    define them become the hot units. Candidate flags are appended to the
+    baseline flags for the hot units only; everything else keeps the baseline.
+
+    Profiles only name functions, so a :code:`static` function defined under
+    the same name in several units can't be told apart: all the units that
+    define it are treated as hot, and its time is reported under the one name.
+    """
+
+    def __init__(self, evaluator: cbench_evaluator, baseline_flags: List[str],
+                 coverage: float = 0.9) -> None:
+        self.evaluator = evaluator
+        self.builder = evaluator.builder
+        self.profiler = function_profiler(evaluator)
+        self.baseline_flags = baseline_flags
+        self.coverage = coverage
+        self.baseline_profile = None
+        self.hot_units = []
+        self.best = None
+
+    # which sources define each function, from the symbol tables of the objects
+    def function_sources(self) -> Dict[str, List[str]]:
+        self.builder.build(self.baseline_flags, output=None)
+        sources = defaultdict(list)
+        for src, obj in self.builder.objects.items():
+            symbols = subprocess.check_output(["nm", "--defined-only", obj],
+                                              universal_newlines=True)
+            for line in symbols.splitlines():
+                bits = line.split()
+                if len(bits) == 3 and bits[1] in "TtWw":
+                    func = _base_name(bits[2])
+                    if src not in sources[func]:
+                        sources[func].append(src)
+        return sources
+
+    def find_hot_units(self) -> List[str]:
+        self.baseline_profile = self.profiler.profile(self.baseline_flags)
+        sources = self.function_sources()
+        total = sum(self.baseline_profile.values())
+        covered = 0.0
+        self.hot_units = []
+        for func, seconds in sorted(self.baseline_profile.items(), key=lambda x: -x[1]):
+            if covered >= self.coverage * total:
+                break
+            covered += seconds
+            units = sources.get(func, [])
+            if len(units) > 1:
+                logger.warning("Hot function %s is defined in %s; tuning all of them",
+                               func, ", ".join(units))
+            for src in units:
+                if src not in self.hot_units:
+                    self.hot_units.append(src)
+        return self.hot_units
+
+    def tu_flags(self, flags: List[str]) -> Dict[str, List[str]]:
+        return {src: self.baseline_flags + flags for src in self.hot_units}
+
+    def evaluate(self, flags: List[str]) -> float:
+        return self.evaluator.evaluate(self.baseline_flags, self.tu_flags(flags))
+
+    def tune(self, sampler, to_opts: Callable[[List[int]], List[str]], rounds: int) -> Tuple[List[str], float]:
+        """Run :code:`rounds` ask/tell rounds of :code:`sampler` on the hot units.
+
+        :code:`to_opts` turns a configuration from the sampler into flags
+        (e.g. :code:`flag_space.to_opts`). Returns the best flags and cost.
+        """
+        if not self.hot_units:
+            self.find_hot_units()
+        self.best = ([], self.evaluate([]))
+        for _ in range(rounds):
+            batch = sampler.ask()
+            costs = []
+            for choices in batch:
+                flags = to_opts(choices)
+                cost = self.evaluate(flags)
+                if cost < self.best[1]:
+                    self.best = (flags, cost)
+                costs.append(cost)
+            sampler.tell(batch, costs)
+        return self.best
+
+    def report(self) -> List[Tuple[str, float, float]]:
+        """Per-function time (function, seconds before, seconds after) for
+        the baseline and the best configuration found, hottest first.
+        """
+        if self.best is None:
+            raise RuntimeError("report() needs a best configuration; run tune() first")
+        if self.baseline_profile is None:
+            self.find_hot_units()
+        after = self.profiler.profile(self.baseline_flags, self.tu_flags(self.best[0]))
+        funcs = set(self.baseline_profile) | set(after)
+        rows = [(f, self.baseline_profile.get(f, 0.0), after.get(f, 0.0)) for f in funcs]
+        return sorted(rows, key=lambda x: -x[1])
+
+
+if __name__ == "__main__":
+    builder = cbench_builder("./benchmark/cBench/automotive_bitcount/src_work")
+    tuner = hot_tuner(cbench_evaluator(builder), ["-O2"])
+    print("hot units = ", tuner.find_hot_units())
+    for func, seconds in sorted(tuner.baseline_profile.items(), key=lambda x: -x[1])[:10]:
+        print(f"{func:30s} {seconds:8.3f}s")
@@ -0,0 +1,126 @@
+#
+# file: minimize.py
+# function: reduce a tuned flag configuration to the flags that matter (delta debugging)
+#
+
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import math
+import os
+from build import cbench_builder
+from evaluate import cbench_evaluator
+
+
+def _split(flags: List[str], n: int) -> List[List[str]]:
+    size, rest = divmod(len(flags), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < rest else 0)
+        chunks.append(flags[start:end])
+        start = end
+    return chunks
+
+
+class flag_minimizer():
+    """Find a small subset of a flag configuration that keeps its speedup.
+
+    A subset passes when its cost is within :code:`tolerance` (relative) of
+    the cost of the full configuration. The search is ddmin: the flags are
+    split into n chunks, and every chunk and every complement is built
+    concurrently on :code:`workers` threads, then timed one after another.
+    The smallest passing subset is kept, otherwise the granularity is
+    doubled, until no single flag can be removed. Flags are always added after
+    :code:`baseline_flags`.
+
+    Builds and measurements are reused through the evaluator's caches, so
+    subsets that were already tried, or that generate the same code, cost
+    nothing extra.
+    """
+
+    def __init__(self, evaluator: cbench_evaluator, baseline_flags: Optional[List[str]] = None,
+                 tolerance: float = 0.02, workers: Optional[int] = None) -> None:
+        self.evaluator = evaluator
+        self.baseline_flags = baseline_flags or []
+        self.tolerance = tolerance
+        self.workers = workers or os.cpu_count()
+        self.target = None
+
+    def evaluate_all(self, configs: List[List[str]]) -> List[float]:
+        # build concurrently, but time one binary at a time so runs don't
+        # compete with each other or with compiles for the cores
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            binaries = list(pool.map(
+                lambda flags: self.evaluator.build(self.baseline_flags + flags), configs
+            ))
+        return [self.evaluator.measure(binary) for binary in binaries]
+
+    def passes(self, cost: float) -> bool:
+        return cost <= self.target * (1 + self.tolerance)
+
+    def minimize(self, flags: List[str]) -> List[str]:
+        """Return the minimal subset of :code:`flags`, in their original order.
+
+        Raises :code:`RuntimeError` if :code:`flags` itself fails to build or run.
+        """
+        full, empty = self.evaluate_all([flags, []])
+        if not math.isfinite(full):
+            raise RuntimeError(f"Configuration to minimize fails to build or run: {flags}")
+        self.target = full
+        if self.passes(empty):
+            return []
+
+        config, n = list(flags), 2
+        while len(config) >= 2:
+            chunks = _split(config, n)
+            complements = [
+                [flag for j, chunk in enumerate(chunks) if j != i for flag in chunk]
+                for i in range(len(chunks))
+            ]
+            costs = self.evaluate_all(chunks + complements)
+            chunk_costs, complement_costs = costs[:n], costs[n:]
+
+            passing = [i for i in range(n) if self.passes(chunk_costs[i])]
+            if passing:
+                config = chunks[min(passing, key=lambda i: chunk_costs[i])]
+                n = 2
+                continue
+            passing = [i for i in range(n) if self.passes(complement_costs[i])]
+            if passing:
+                config = complements[min(passing, key=lambda i: complement_costs[i])]
+                n = max(n - 1, 2)
+                continue
+            if n >= len(config):
+                break
+            n = min(2 * n, len(config))
+        return config
+
+    def contributions(self, flags: List[str]) -> Dict[str, float]:
+        """Relative slowdown when each flag is removed on its own from :code:`flags`.
+
+        Flags whose removal breaks the build or the run are left out.
+        """
+        configs = [flags] + [flags[:i] + flags[i + 1:] for i in range(len(flags))]
+        costs = self.evaluate_all(configs)
+        if not math.isfinite(costs[0]):
+            raise RuntimeError(f"Configuration fails to build or run: {flags}")
+        return {
+            flag: cost / costs[0] - 1
+            for flag, cost in zip(flags, costs[1:])
+            if math.isfinite(cost)
+        }
+
+    def run(self, flags: List[str]) -> Tuple[List[str], Dict[str, float]]:
+        minimal = self.minimize(flags)
+        return minimal, self.contributions(minimal)
+
+
+if __name__ == "__main__":
+    builder = cbench_builder("./benchmark/cBench/automotive_bitcount/src_work")
+    minimizer = flag_minimizer(cbench_evaluator(builder))
+    minimal, contributions = minimizer.run(
+        ["-O2", "-funroll-loops", "-fno-inline", "-fomit-frame-pointer", "-fpeel-loops"]
+    )
+    print("minimal = ", minimal)
+    for flag, contribution in contributions.items():
+        print(f"{flag:30s} {contribution:+.2%}")
@@ -0,0 +1,109 @@
+#
+# file: pgo.py
+# function: profile-guided optimization stage with cached training profiles
+#
+
+
+from typing import Dict, List, Optional
+import threading
+import hashlib
+import shutil
+import os
+from build import cbench_builder
+from evaluate import cbench_evaluator
+
+
+class pgo_stage():
+    """Build candidates with :code:`-fprofile-use` against a cached profile.
+
+    The profile comes from one instrumented build (:code:`instr_flags` plus
+    :code:`-fprofile-generate`) run from the build cache on each training
+    dataset's command line and loop-wrap count, as :code:`__run` would, so
+    the program's :code:`a.out` is left untouched. The :code:`.gcda` files
+    are stored under :code:`<cache_dir>/profiles/` keyed on the source
+    directory and hash, the instrumentation flags, the training datasets and
+    the compiler id. Every configuration sharing those settings reuses the
+    same profile, and the training run happens once per benchmark, even when
+    several threads ask for it at once.
+    """
+
+    def __init__(self, builder: cbench_builder, instr_flags: Optional[List[str]] = None,
+                 datasets: Optional[List[int]] = None) -> None:
+        self.builder = builder
+        self.instr_flags = instr_flags or ["-O2"]
+        self.datasets = datasets or [1]
+        self.profile_root = os.path.join(builder.cache_dir, "profiles")
+        os.makedirs(self.profile_root, exist_ok=True)
+        self.profile_dir = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def profile_key(self) -> str:
+        # the .gcda files are looked up under the absolute source directory
+        parts = [self.builder.src_dir, self.builder.source_hash(), self.builder.compiler_id]
+        parts += self.builder.cflags + self.instr_flags + [str(d) for d in self.datasets]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def train(self, profile_dir: str) -> None:
+        """Build the instrumented binary, run the training datasets and store
+        the profile in :code:`profile_dir`.
+        """
+        tmp = f"{profile_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            binary = self.builder.build(self.instr_flags + [f"-fprofile-generate={tmp}"],
+                                        output=None)
+            for dataset in self.datasets:
+                cbench_evaluator(self.builder, dataset).run(binary)
+            try:
+                os.replace(tmp, profile_dir)
+            except OSError:
+                # another process stored the same profile first
+                if not os.path.isdir(profile_dir):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def get_profile_dir(self) -> str:
+        """Directory holding the training profile, training it on first use.
+
+        If training fails, :code:`RuntimeError` is raised, and raised again on
+        every later call without retrying the training.
+        """
+        failed = f"PGO training failed for {self.builder.src_dir}"
+        if self.profile_dir is None:
+            with self.lock:
+                if self.error is not None:
+                    raise RuntimeError(failed) from self.error
+                if self.profile_dir is None:
+                    profile_dir = os.path.join(self.profile_root, self.profile_key())
+                    if not os.path.isdir(profile_dir):
+                        try:
+                            self.train(profile_dir)
+                        except Exception as e:
+                            self.error = e
+                            raise RuntimeError(failed) from e
+                    self.profile_dir = profile_dir
+        return self.profile_dir
+
+    def use_flags(self, flags: List[str]) -> List[str]:
+        """:code:`flags` plus the options to build against the cached profile.
+
+        Functions whose control flow no longer matches the profile (some
+        candidate flags change early passes) fall back to no profile instead
+        of failing the build.
+        """
+        return flags + [f"-fprofile-use={self.get_profile_dir()}",
+                        "-Wno-error=coverage-mismatch", "-Wno-missing-profile"]
+
+    def use_tu_flags(self, tu_flags: Optional[Dict[str, List[str]]]) -> Optional[Dict[str, List[str]]]:
+        if not tu_flags:
+            return tu_flags
+        return {src: self.use_flags(flags) for src, flags in tu_flags.items()}
+
+
+if __name__ == "__main__":
+    builder = cbench_builder("./benchmark/cBench/automotive_bitcount/src_work")
+    pgo = pgo_stage(builder)
+    print("profile = ", pgo.get_profile_dir())
+    print(builder.build(pgo.use_flags(["-O3"]), output=None))